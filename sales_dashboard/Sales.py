@@ -1,14 +1,18 @@
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.io as pio
 import streamlit as st
-from pathlib import Path
 
-
-BASE_DIR = Path(__file__).resolve().parent
-DATA_DIR = BASE_DIR/"sales_dashboard"
-if not DATA_DIR.exists():
-    DATA_DIR = BASE_DIR
+from data import (
+    DATA_DIR,
+    MONTH_ORDER,
+    YEAR_ORDER,
+    compute_alltime_aggs,
+    compute_year_aggs,
+    fig_to_html_bytes,
+    load_all_data,
+)
 
 
 st.set_page_config(page_title="AFC Sales Dashboard", layout="wide")
@@ -18,14 +22,6 @@ st.set_page_config(page_title="AFC Sales Dashboard", layout="wide")
 # -------------------------
 px.defaults.template = "seaborn"
 
-# -------------------------
-# Cached helpers (fast)
-# -------------------------
-@st.cache_data(show_spinner=False)
-def fig_to_html_bytes(fig_json: str) -> bytes:
-    fig = pio.from_json(fig_json)
-    return fig.to_html(include_plotlyjs="cdn").encode("utf-8")
-
 # -------------------------
 # Header
 # -------------------------
@@ -41,30 +37,8 @@ paths = {
     "2025": DATA_DIR /"AFC SALES BY CUSTOMER TYPE 2025.CSV",
 }
 
-MONTH_ORDER = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
-YEAR_ORDER = ["2023", "2024", "2025"]
-
-dfs = []
-for year_str, path in paths.items():
-    df = pd.read_csv(path)
-    df = df.rename(columns={df.columns[0]: "CustomerType"})
-    df = df[df["CustomerType"].astype(str).str.upper() != "TOTAL"]
-
-    month_cols = [c for c in df.columns if c not in ["CustomerType", "TOTAL"]]
-
-    long_df = df.melt(
-        id_vars="CustomerType",
-        value_vars=month_cols,
-        var_name="Month",
-        value_name="Sales"
-    )
-
-    long_df["Month"] = long_df["Month"].astype(str).str[:3]
-    long_df["Month"] = pd.Categorical(long_df["Month"], categories=MONTH_ORDER, ordered=True)
-    long_df["Year"] = year_str
-    dfs.append(long_df)
-
-data = pd.concat(dfs, ignore_index=True)
+data_version = tuple(p.stat().st_mtime for p in paths.values())
+data, cube, seen = load_all_data(tuple(sorted(paths.items())), data_version)
 
 # -------------------------
 # Sidebar controls
@@ -81,38 +55,7 @@ enable_downloads = st.sidebar.toggle("Enable downloads (HTML only)", value=False
 # -------------------------
 # Prep: Selected-year data
 # -------------------------
-year_df = data[data["Year"] == selected_year].copy()
-
-top_types_year = (
-    year_df.groupby("CustomerType", as_index=False)["Sales"].sum()
-    .sort_values("Sales", ascending=False)
-    .head(top_n)["CustomerType"]
-)
-year_df = year_df[year_df["CustomerType"].isin(top_types_year)]
-
-monthly_grouped = (
-    year_df.groupby(["Month", "CustomerType"], as_index=False)["Sales"].sum()
-)
-
-# -------------------------
-# Prep: All-years summaries
-# -------------------------
-year_totals = data.groupby("Year", as_index=False)["Sales"].sum()
-
-comparison_by_type = (
-    data.groupby(["Year", "CustomerType"], as_index=False)["Sales"].sum()
-)
-
-overall_top_types = (
-    data.groupby("CustomerType", as_index=False)["Sales"].sum()
-    .sort_values("Sales", ascending=False)
-    .head(top_n)["CustomerType"]
-)
-comparison_by_type = comparison_by_type[comparison_by_type["CustomerType"].isin(overall_top_types)]
-
-totals_by_year_type = (
-    data.groupby(["Year", "CustomerType"], as_index=False)["Sales"].sum()
-)
+year_df, monthly_grouped, type_totals = compute_year_aggs(data, cube, seen, data_version, selected_year, top_n)
 
 # -------------------------
 # KPI Row
@@ -121,11 +64,7 @@ k1, k2, k3, k4 = st.columns(4)
 
 selected_year_total = year_df["Sales"].sum()
 all_years_total = data["Sales"].sum()
-selected_year_top = (
-    year_df.groupby("CustomerType", as_index=False)["Sales"].sum()
-    .sort_values("Sales", ascending=False)
-    .head(1)
-)
+selected_year_top = type_totals.head(1)
 
 top_type_label = selected_year_top.iloc[0]["CustomerType"] if len(selected_year_top) else "—"
 top_type_value = selected_year_top.iloc[0]["Sales"] if len(selected_year_top) else 0
@@ -140,101 +79,102 @@ st.divider()
 # -------------------------
 # Build figures
 # -------------------------
-fig_monthly = px.bar(
-    monthly_grouped,
-    x="Month",
-    y="Sales",
-    color="CustomerType",
-    barmode="group",
-    title=f"Monthly Sales by Customer Type — {selected_year} (Top {top_n})",
-    hover_data={"Sales": ":,.0f"},
-    category_orders={"Month": MONTH_ORDER},
-)
-fig_monthly.update_layout(bargap=0.2, bargroupgap=0.05, legend_title="Customer Type")
-
-pie_df = (
-    year_df.groupby("CustomerType", as_index=False)["Sales"].sum()
-    .sort_values("Sales", ascending=False)
-)
+@st.cache_data(show_spinner=False)
+def build_figures(_data: pd.DataFrame, _cube: np.ndarray, _seen: np.ndarray, data_version: tuple, year: str, top_n: int) -> dict:
+    _, monthly_grouped, type_totals = compute_year_aggs(_data, _cube, _seen, data_version, year, top_n)
+    year_totals, comparison_by_type, totals_by_year_type = compute_alltime_aggs(_data, _cube, _seen, data_version, top_n)
+
+    fig_monthly = px.bar(
+        monthly_grouped,
+        x="Month",
+        y="Sales",
+        color="CustomerType",
+        barmode="group",
+        title=f"Monthly Sales by Customer Type — {year} (Top {top_n})",
+        hover_data={"Sales": ":,.0f"},
+        category_orders={"Month": MONTH_ORDER},
+    )
+    fig_monthly.update_layout(bargap=0.2, bargroupgap=0.05, legend_title="Customer Type")
 
-# Identify largest slice
-max_type = pie_df.iloc[0]["CustomerType"]
+    pie_df = type_totals
 
-# Create pull values (explode only the largest)
-pie_df["Pull"] = pie_df["CustomerType"].apply(
-    lambda x: 0.12 if x == max_type else 0
-)
+    # Identify largest slice
+    max_type = pie_df.iloc[0]["CustomerType"]
 
-fig_pie = px.pie(
-    pie_df,
-    names="CustomerType",
-    values="Sales",
-    title=f"Sales Distribution — {selected_year}",
-    hole=0.40,
-)
-
-# Apply pull AFTER creation
-fig_pie.update_traces(
-    pull=pie_df["Pull"],
-    textinfo="percent+label",
-    marker=dict(line=dict(color="white",width=2))
-)
+    # Create pull values (explode only the largest)
+    pie_df["Pull"] = pie_df["CustomerType"].apply(
+        lambda x: 0.12 if x == max_type else 0
+    )
 
+    fig_pie = px.pie(
+        pie_df,
+        names="CustomerType",
+        values="Sales",
+        title=f"Sales Distribution — {year}",
+        hole=0.40,
+    )
 
+    # Apply pull AFTER creation
+    fig_pie.update_traces(
+        pull=pie_df["Pull"],
+        textinfo="percent+label",
+        marker=dict(line=dict(color="white",width=2))
+    )
 
+    fig_year_donut = px.pie(
+        year_totals,
+        names="Year",
+        values="Sales",
+        hole=0.50,
+        title="Total Sales Share by Year (2023–2025)",
+        category_orders={"Year": YEAR_ORDER},
+    )
 
-fig_year_donut = px.pie(
-    year_totals,
-    names="Year",
-    values="Sales",
-    hole=0.50,
-    title="Total Sales Share by Year (2023–2025)",
-    category_orders={"Year": YEAR_ORDER},
-)
+    fig_year_sections = px.bar(
+        totals_by_year_type,
+        x="Year",
+        y="Sales",
+        color="CustomerType",
+        barmode="group",
+        title="Total Sales by Customer Type for Each Year",
+        hover_data={"Sales": ":,.0f"},
+        category_orders={"Year": YEAR_ORDER},
+    )
+    fig_year_sections.update_layout(
+        xaxis_title="Year",
+        yaxis_title="Total Sales",
+        legend_title="Customer Type",
+        bargap=0.25,
+        bargroupgap=0.08,
+    )
 
+    fig_compare = px.bar(
+        comparison_by_type,
+        x="CustomerType",
+        y="Sales",
+        color="Year",
+        barmode="group",
+        title=f"Customer Type Totals Compared Across Years (Top {top_n})",
+        hover_data={"Sales": ":,.0f"},
+        category_orders={"Year": YEAR_ORDER},
+    )
+    fig_compare.update_layout(
+        xaxis_title="Customer Type",
+        yaxis_title="Total Sales",
+        legend_title="Year",
+    )
 
-fig_year_sections = px.bar(
-    totals_by_year_type,
-    x="Year",
-    y="Sales",
-    color="CustomerType",
-    barmode="group",
-    title="Total Sales by Customer Type for Each Year",
-    hover_data={"Sales": ":,.0f"},
-    category_orders={"Year": YEAR_ORDER},
-)
-fig_year_sections.update_layout(
-    xaxis_title="Year",
-    yaxis_title="Total Sales",
-    legend_title="Customer Type",
-    bargap=0.25,
-    bargroupgap=0.08,
-)
+    # JSON snapshots: rendered via pio.from_json and reused for HTML export
+    return {
+        "monthly": pio.to_json(fig_monthly, pretty=False, engine="orjson"),
+        "year_pie": pio.to_json(fig_pie, pretty=False, engine="orjson"),
+        "year_donut": pio.to_json(fig_year_donut, pretty=False, engine="orjson"),
+        "year_sections": pio.to_json(fig_year_sections, pretty=False, engine="orjson"),
+        "compare": pio.to_json(fig_compare, pretty=False, engine="orjson"),
+    }
 
-fig_compare = px.bar(
-    comparison_by_type,
-    x="CustomerType",
-    y="Sales",
-    color="Year",
-    barmode="group",
-    title=f"Customer Type Totals Compared Across Years (Top {top_n})",
-    hover_data={"Sales": ":,.0f"},
-    category_orders={"Year": YEAR_ORDER},
-)
-fig_compare.update_layout(
-    xaxis_title="Customer Type",
-    yaxis_title="Total Sales",
-    legend_title="Year",
-)
 
-# JSON snapshots for cached HTML export
-fig_json = {
-    "monthly": fig_monthly.to_json(),
-    "year_pie": fig_pie.to_json(),
-    "year_donut": fig_year_donut.to_json(),
-    "year_sections": fig_year_sections.to_json(),
-    "compare": fig_compare.to_json(),
-}
+fig_json = build_figures(data, cube, seen, data_version, selected_year, top_n)
 
 # -------------------------
 # Layout
@@ -242,23 +182,23 @@ fig_json = {
 # Row 1
 c1, c2 = st.columns([2.2, 1], gap="large")
 with c1:
-    st.plotly_chart(fig_monthly, use_container_width=True)
+    st.plotly_chart(pio.from_json(fig_json["monthly"]), use_container_width=True)
 with c2:
-    st.plotly_chart(fig_pie, use_container_width=True)
+    st.plotly_chart(pio.from_json(fig_json["year_pie"]), use_container_width=True)
 
 st.divider()
 
 # Row 2
 c3, c4 = st.columns([1, 2.2], gap="large")
 with c3:
-    st.plotly_chart(fig_year_donut, use_container_width=True)
+    st.plotly_chart(pio.from_json(fig_json["year_donut"]), use_container_width=True)
 with c4:
-    st.plotly_chart(fig_year_sections, use_container_width=True)
+    st.plotly_chart(pio.from_json(fig_json["year_sections"]), use_container_width=True)
 
 st.divider()
 
 # Row 3
-st.plotly_chart(fig_compare, use_container_width=True)
+st.plotly_chart(pio.from_json(fig_json["compare"]), use_container_width=True)
 
 # -------------------------
 # HTML Downloads (safe for deployment)
@@ -304,8 +244,16 @@ if enable_downloads:
 # -------------------------
 # Optional: Underlying data
 # -------------------------
+@st.cache_data(show_spinner=False)
+def _cached_table(_data: pd.DataFrame, _cube: np.ndarray, _seen: np.ndarray, data_version: tuple, year: str, top_n: int):
+    year_df, _, _ = compute_year_aggs(_data, _cube, _seen, data_version, year, top_n)
+    return year_df.groupby(["CustomerType", "Month"], as_index=False, observed=True)["Sales"].sum()
+
+
+# The expander body runs even when collapsed, so the table is behind an explicit checkbox
 with st.expander("Show underlying data (selected year)"):
-    st.dataframe(
-        year_df.groupby(["CustomerType", "Month"], as_index=False)["Sales"].sum(),
-        use_container_width=True
-    )
\ No newline at end of file
+    if st.checkbox("Load table", key="show_tbl"):
+        st.dataframe(
+            _cached_table(data, cube, seen, data_version, selected_year, top_n),
+            use_container_width=True
+        )
\ No newline at end of file
@@ -0,0 +1,233 @@
+import codecs
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+import charset_normalizer
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+import streamlit as st
+
+# -------------------------
+# Shared paths / constants (imported by Sales.py and every page)
+# -------------------------
+BASE_DIR = Path(__file__).resolve().parent  # .../sales_dashboard
+DATA_DIR = BASE_DIR / "sales_dashboard"     # optional subfolder for CSVs
+if not DATA_DIR.exists():
+    DATA_DIR = BASE_DIR                     # fallback: CSVs next to Sales.py
+
+CACHE_DIR = DATA_DIR / ".cache"             # parquet copies of the parsed CSVs
+
+MONTH_ORDER = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
+YEAR_ORDER = ["2023", "2024", "2025"]
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def _detect_encoding(path) -> str:
+    # Sniff once instead of re-parsing the whole CSV per candidate encoding. The exports
+    # are a few hundred KB and their first non-ASCII byte can sit well past any head
+    # sample (>150 KB into the Item files), so the whole file is checked.
+    with open(path, "rb") as f:
+        sample = f.read()
+
+    for bom, enc in _BOMS:
+        if sample.startswith(bom):
+            return enc
+
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    # QuickBooks on Windows exports cp1252; statistical detection tends to call that
+    # cp1250 and turn "ñ" into "ń", so only consult it when cp1252 can't decode the sample
+    try:
+        sample.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        pass
+
+    best = charset_normalizer.from_bytes(sample).best()
+    return best.encoding if best is not None else "latin1"
+
+
+def candidate_encodings(path) -> list:
+    # Sniffed encoding first; the fallbacks only matter if charset-normalizer guessed wrong
+    return list(dict.fromkeys((_detect_encoding(path), "cp1252", "latin1")))
+
+
+def cached_parquet(sources, build, *key_parts) -> pd.DataFrame:
+    # Disk (L2) cache under st.cache_data: keyed on each source's path/mtime/size plus
+    # key_parts (loader name + format version), so restarts skip CSV parsing entirely.
+    # Files are named "<key_parts digest>-<full digest>" so stale copies for the same
+    # loader/version can be pruned whenever a new one is written.
+    prefix = hashlib.blake2b("|".join(map(str, key_parts)).encode(), digest_size=6).hexdigest()
+    stamp = "|".join(f"{p}|{os.path.getmtime(p)}|{os.path.getsize(p)}" for p in sources)
+    key = hashlib.blake2b("|".join([stamp, *map(str, key_parts)]).encode(), digest_size=16).hexdigest()
+    cache_path = CACHE_DIR / f"{prefix}-{key}.parquet"
+
+    if cache_path.exists():
+        try:
+            return pd.read_parquet(cache_path)
+        except Exception:
+            pass  # partial/corrupt file: rebuild below
+
+    df = build()
+    tmp_path = None
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=CACHE_DIR, suffix=".tmp", delete=False) as tmp:
+            tmp_path = tmp.name
+        df.to_parquet(tmp_path, compression="zstd")
+        os.replace(tmp_path, cache_path)
+        tmp_path = None
+        for old in CACHE_DIR.glob(f"{prefix}-*.parquet"):
+            if old != cache_path:
+                old.unlink(missing_ok=True)
+    except Exception:
+        pass  # read-only deploy / unserialisable frame: just run without the disk layer
+    finally:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+    return df
+
+
+# -------------------------
+# Figures / HTML downloads
+# -------------------------
+# Each page builds its charts in a cached build_figures() that returns orjson figure JSON.
+# Frames go in as underscore args (never hashed); the scalars they are derived from
+# (data_version, year, top_n, ...) are the cache key. Charts and downloads share that JSON.
+@st.cache_data(show_spinner=False)
+def _fig_html(key: str, _fig_json: str) -> bytes:
+    fig = pio.from_json(_fig_json)
+    return pio.to_html(fig, include_plotlyjs="cdn").encode("utf-8")
+
+
+def fig_to_html_bytes(fig_json: str) -> bytes:
+    # Cache on a 16-byte digest so Streamlit never hashes the (large) JSON string itself
+    return _fig_html(hashlib.blake2b(fig_json.encode(), digest_size=16).hexdigest(), fig_json)
+
+
+# -------------------------
+# Customer-type loader + cached aggregates
+# -------------------------
+@st.cache_data(show_spinner=False)
+def load_all_data(paths_items: tuple, mtimes: tuple):
+    # mtimes is only part of the cache key, so edited CSVs get re-read
+    dfs = []
+    for year_str, path in paths_items:
+        df = pd.read_csv(path, engine="pyarrow")
+        df = df.rename(columns={df.columns[0]: "CustomerType"})
+        df = df[df["CustomerType"].astype(str).str.upper() != "TOTAL"]
+
+        month_cols = [c for c in df.columns if c not in ["CustomerType", "TOTAL"]]
+
+        long_df = df.melt(
+            id_vars="CustomerType",
+            value_vars=month_cols,
+            var_name="Month",
+            value_name="Sales"
+        )
+
+        long_df["Month"] = pd.Categorical(
+            long_df["Month"].astype(str).str.slice(stop=3), categories=MONTH_ORDER, ordered=True
+        )
+        long_df["Year"] = year_str
+        dfs.append(long_df)
+
+    data = pd.concat(dfs, ignore_index=True)
+
+    # Categorical keys let groupby work on int codes instead of hashing strings
+    data["CustomerType"] = data["CustomerType"].astype("category")
+    data["Year"] = pd.Categorical(data["Year"], categories=YEAR_ORDER, ordered=True)
+
+    # Dense (Year, CustomerType, Month) cube so the chart aggregates are plain numpy
+    # reductions; `seen` marks the cells that exist in the CSVs (a zero is still a cell)
+    codes = np.vstack([
+        data["Year"].cat.codes.to_numpy(),
+        data["CustomerType"].cat.codes.to_numpy(),
+        data["Month"].cat.codes.to_numpy(),
+    ])
+    valid = (codes >= 0).all(axis=0)
+    idx = tuple(codes[:, valid])
+
+    shape = (len(YEAR_ORDER), len(data["CustomerType"].cat.categories), len(MONTH_ORDER))
+    cube = np.zeros(shape)
+    seen = np.zeros(shape, dtype=bool)
+    np.add.at(cube, idx, np.nan_to_num(data["Sales"].to_numpy(dtype=float)[valid]))
+    seen[idx] = True
+    return data, cube, seen
+
+
+def _top_codes(sales: np.ndarray, present: np.ndarray, top_n: int) -> np.ndarray:
+    # Largest-first category codes among the present types (stable, like nlargest)
+    candidates = np.flatnonzero(present)
+    order = np.argsort(-sales[candidates], kind="stable")
+    return candidates[order][:top_n]
+
+
+# _data/_cube/_seen are skipped by Streamlit's hasher; data_version (the CSV mtimes) keys the cache instead
+@st.cache_data(show_spinner=False)
+def compute_year_aggs(_data: pd.DataFrame, _cube: np.ndarray, _seen: np.ndarray, data_version: tuple, year: str, top_n: int):
+    types = _data["CustomerType"].cat.categories
+    year_idx = YEAR_ORDER.index(year)
+    year_cube, year_seen = _cube[year_idx], _seen[year_idx]
+
+    type_sales = year_cube.sum(axis=1)
+    top_codes = _top_codes(type_sales, year_seen.any(axis=1), top_n)
+    type_totals = pd.DataFrame({
+        "CustomerType": pd.Categorical.from_codes(top_codes, categories=types),
+        "Sales": type_sales[top_codes],
+    })
+
+    # Month-major, then type code: same row order the groupby produced, so Plotly colours don't shift
+    sel = np.sort(top_codes)
+    month_idx, pos = np.nonzero(year_seen[sel].T)
+    monthly_grouped = pd.DataFrame({
+        "Month": pd.Categorical.from_codes(month_idx, categories=MONTH_ORDER, ordered=True),
+        "CustomerType": pd.Categorical.from_codes(sel[pos], categories=types),
+        "Sales": year_cube[sel[pos], month_idx],
+    })
+
+    # Year categories are YEAR_ORDER, so year_idx is also the Year code; one int mask, no string compares
+    mask = (_data["Year"].cat.codes.to_numpy() == year_idx) & np.isin(
+        _data["CustomerType"].cat.codes.to_numpy(), top_codes
+    )
+    year_df = _data[mask]
+    return year_df, monthly_grouped, type_totals
+
+
+@st.cache_data(show_spinner=False)
+def compute_alltime_aggs(_data: pd.DataFrame, _cube: np.ndarray, _seen: np.ndarray, data_version: tuple, top_n: int):
+    types = _data["CustomerType"].cat.categories
+    year_type = _cube.sum(axis=2)
+    year_type_seen = _seen.any(axis=2)
+
+    year_idx, type_idx = np.nonzero(year_type_seen)
+    totals_by_year_type = pd.DataFrame({
+        "Year": pd.Categorical.from_codes(year_idx, categories=YEAR_ORDER, ordered=True),
+        "CustomerType": pd.Categorical.from_codes(type_idx, categories=types),
+        "Sales": year_type[year_idx, type_idx],
+    })
+
+    years_present = np.flatnonzero(year_type_seen.any(axis=1))
+    year_totals = pd.DataFrame({
+        "Year": pd.Categorical.from_codes(years_present, categories=YEAR_ORDER, ordered=True),
+        "Sales": year_type.sum(axis=1)[years_present],
+    })
+
+    top_codes = _top_codes(year_type.sum(axis=0), year_type_seen.any(axis=0), top_n)
+    comparison_by_type = totals_by_year_type[np.isin(type_idx, top_codes)]
+    return year_totals, comparison_by_type, totals_by_year_type
@@ -1,81 +1,150 @@
-from pathlib import Path
+import csv
+
+import numpy as np
 import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
 import plotly.io as pio
 import streamlit as st
 
-st.set_page_config(page_title="Purchases by Vendor", layout="wide")
-px.defaults.template = "seaborn"
+from data import DATA_DIR, MONTH_ORDER, YEAR_ORDER, cached_parquet, candidate_encodings, fig_to_html_bytes
 
-MONTH_ORDER = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
-YEAR_ORDER = ["2023", "2024", "2025"]
+st.set_page_config(page_title="Purchases by Vendor", layout="wide")
+TEMPLATE = "seaborn"  # plotly template shared by every chart on this page
 
 # -------------------------
-# Bulletproof paths
+# Paths (DATA_DIR is resolved once in data.py)
 # -------------------------
-BASE_DIR = Path(__file__).resolve().parent.parent  # .../sales_dashboard
-DATA_DIR = BASE_DIR / "sales_dashboard"           # optional subfolder for CSVs
-if not DATA_DIR.exists():
-    DATA_DIR = BASE_DIR                           # fallback: CSVs next to app.py
-
 PATHS = {
     "2023": DATA_DIR / "AFC PURCHASES BY VENDOR SUMMARY 2023.CSV",
     "2024": DATA_DIR / "AFC PURCHASES BY VENDOR SUMMARY 2024.CSV",
     "2025": DATA_DIR / "AFC PURCHASES BY VENDOR SUMMARY 2025.CSV",
 }
 
+TOP_N_MAX = 70  # upper bound of the Top N slider
+
 # -------------------------
 # Cached helpers
 # -------------------------
-@st.cache_data(show_spinner=False)
-def load_purchases_long(paths: dict) -> pd.DataFrame:
-    dfs = []
+def read_vendor_csv(path) -> pd.DataFrame:
+    # Normally a single parse: the first candidate is the sniffed encoding
+    encodings = candidate_encodings(path)
+    for enc in encodings:
+        try:
+            # Read the header row alone so the parser can skip the TOTAL column outright
+            with open(path, newline="", encoding=enc) as f:
+                header = next(csv.reader(f))
+            keep = [c for c in header if c.strip().upper() != "TOTAL"]
+
+            # Arrow's multithreaded reader; month columns already come back as float64
+            return pd.read_csv(path, engine="pyarrow", usecols=keep, encoding=enc)
+        except UnicodeDecodeError:
+            continue
+    st.error(f"Could not decode file: {path}\nTried {', '.join(encodings)}.")
+    st.stop()
+
+
+def _build_purchases_long(paths: dict) -> pd.DataFrame:
+    wide_parts = []
     for year, path in paths.items():
-        df = pd.read_csv(path)
-        df = df.rename(columns={df.columns[0]: "Vendor"})
-        df = df[df["Vendor"].astype(str).str.upper() != "TOTAL"]
+        df = read_vendor_csv(path)
 
-        month_cols = [c for c in df.columns if c not in ["Vendor", "TOTAL", "Total", "total"]]
+        # Month headers carry the year ("Jan 23"), so key them by month alone before stacking
+        month_cols = df.columns[1:]
+        df = df.rename(columns={df.columns[0]: "Vendor", **{c: str(c)[:3] for c in month_cols}})
+        wide_parts.append(df.assign(Year=str(year)))
 
-        long_df = df.melt(
-            id_vars="Vendor",
-            value_vars=month_cols,
-            var_name="Month",
-            value_name="Purchases",
-        )
+    # One TOTAL filter, melt and type pass for all years
+    wide = pd.concat(wide_parts, ignore_index=True)
+
+    # Vendor cleanup runs on the wide frame (one row per vendor), not on 12x melted rows
+    vendor = wide["Vendor"].astype(str)
+    stripped = vendor.str.strip()
+    wide = wide.assign(Vendor=stripped)[(vendor.str.upper() != "TOTAL") & (stripped != "")]
+
+    # Categorize before the melt so it tiles small integer codes instead of 12x object strings
+    wide = wide.astype({"Vendor": "category", "Year": "category"})
+
+    data = wide.melt(
+        id_vars=["Vendor", "Year"],
+        var_name="Month",
+        value_name="Purchases",
+    )
+
+    data["Month"] = pd.Categorical(data["Month"], categories=MONTH_ORDER, ordered=True)
+    data["Purchases"] = pd.to_numeric(data["Purchases"], errors="coerce").fillna(0)
+    return data[["Vendor", "Month", "Purchases", "Year"]]
+
+
+@st.cache_data(show_spinner=False)
+def load_purchases_long(paths: dict, mtimes: tuple) -> pd.DataFrame:
+    # mtimes only invalidates the cache when a CSV changes
+    # Bump the trailing version if the parsing above changes, so stale parquet is ignored
+    return cached_parquet(paths.values(), lambda: _build_purchases_long(paths), "purchases_long", 4)
 
-        long_df["Month"] = long_df["Month"].astype(str).str[:3]
-        long_df["Month"] = pd.Categorical(long_df["Month"], categories=MONTH_ORDER, ordered=True)
 
-        long_df["Purchases"] = pd.to_numeric(long_df["Purchases"], errors="coerce").fillna(0)
-        long_df["Vendor"] = long_df["Vendor"].astype(str).str.strip()
-        long_df["Year"] = str(year)
+def top_rows(totals: pd.DataFrame, n: int) -> pd.DataFrame:
+    # Partition to the n largest (plus any ties at the cutoff), then sort only those rows
+    vals = totals["Purchases"].to_numpy()
+    if len(vals) > n:
+        kth = np.partition(vals, len(vals) - n)[len(vals) - n]
+        totals = totals[vals >= kth]
+    return totals.sort_values(by=["Purchases", "Vendor"], ascending=[False, True]).head(n)
 
-        dfs.append(long_df)
 
-    data = pd.concat(dfs, ignore_index=True)
-    data = data[data["Vendor"] != ""]
-    return data
+def pull_largest(values: np.ndarray) -> np.ndarray:
+    # Explode only the largest slice (first one on ties, like idxmax)
+    pull = np.zeros(len(values))
+    if len(values):
+        pull[values.argmax()] = 0.12
+    return pull
 
 
 @st.cache_data(show_spinner=False)
-def fig_to_html_bytes(fig_json: str) -> bytes:
-    fig = pio.from_json(fig_json)
-    return fig.to_html(include_plotlyjs="cdn").encode("utf-8")
+def build_aggregates(paths: dict, data_version: tuple) -> dict:
+    # Every groupby the page needs, reduced once per data load; reruns only slice these.
+    # Groups come back unsorted; rankings sort explicitly, with ties broken by vendor name
+    data = load_purchases_long(paths, data_version)
+    rank = dict(by=["Purchases", "Vendor"], ascending=[False, True])
+
+    # Per-year vendor stats split the (Year, Vendor) sums instead of gathering each
+    # year's melted rows; observed=True keeps only the vendors listed in that year's CSV
+    # (zero-spend rows included), so len() of each frame is the Active Vendors KPI
+    vendor_year = data.groupby(["Year", "Vendor"], as_index=False, observed=True, sort=False)["Purchases"].sum()
+    months_by_year = data.groupby("Year", observed=True)["Month"].nunique()
+
+    return {
+        "year_totals": data.groupby("Year", as_index=False, observed=True, sort=False)["Purchases"].sum(),
+        # Only ever read through head(top_n), so keep just the slider's maximum
+        "vendor_totals": top_rows(
+            data.groupby("Vendor", as_index=False, observed=True, sort=False)["Purchases"].sum(),
+            TOP_N_MAX,
+        ),
+        "vendor_year": vendor_year,
+        "vendor_totals_by_year": {
+            year: (
+                g[["Vendor", "Purchases"]]
+                .sort_values(**rank)
+                # One melted row per vendor per month column, so the monthly mean is just sum / months
+                .assign(AvgMonthly=lambda t: t["Purchases"] / months_by_year[year])
+            )
+            for year, g in vendor_year.groupby("Year", observed=True, sort=False)
+        },
+    }
 
 
 # -------------------------
 # Load data
 # -------------------------
-data = load_purchases_long(PATHS)
+data_version = tuple(p.stat().st_mtime for p in PATHS.values())
+aggs = build_aggregates(PATHS, data_version)
 
 # -------------------------
 # Sidebar controls
 # -------------------------
 st.sidebar.header("Filters")
-available_years = [y for y in YEAR_ORDER if y in set(data["Year"].unique())]
+available_years = [y for y in YEAR_ORDER if y in aggs["vendor_totals_by_year"]]
 selected_year = st.sidebar.selectbox("Year", available_years, index=len(available_years)-1)
-top_n = st.sidebar.slider("Top N vendors", 3, 70, 10)
+top_n = st.sidebar.slider("Top N vendors", 3, TOP_N_MAX, 10)
 enable_downloads = st.sidebar.toggle("Enable downloads (HTML only)", value=False)
 
 # -------------------------
@@ -87,42 +156,180 @@ st.caption("High-level view of vendor spend: concentration, top vendors, and yea
 # -------------------------
 # Prep: Selected-year data
 # -------------------------
-year_df = data[data["Year"] == selected_year].copy()
-
-vendor_totals_year = (
-    year_df.groupby("Vendor", as_index=False)["Purchases"]
-    .sum()
-    .sort_values("Purchases", ascending=False)
-)
+vendor_stats_year = aggs["vendor_totals_by_year"][selected_year]
+vendor_totals_year = vendor_stats_year[["Vendor", "Purchases"]]
 
 top_vendor = vendor_totals_year.iloc[0]["Vendor"] if len(vendor_totals_year) else "—"
 top_vendor_amt = vendor_totals_year.iloc[0]["Purchases"] if len(vendor_totals_year) else 0
 total_year = vendor_totals_year["Purchases"].sum()
 top_vendor_share = (top_vendor_amt / total_year * 100) if total_year else 0
-active_vendors = year_df["Vendor"].nunique()
-
-top_vendors_year = vendor_totals_year.head(top_n)["Vendor"].tolist()
-vendor_order_year = top_vendors_year[:]
+active_vendors = len(vendor_stats_year)
 
 # -------------------------
 # Prep: All-years (overall)
 # -------------------------
-year_totals_all = data.groupby("Year", as_index=False)["Purchases"].sum()
-
-overall_vendor_totals = (
-    data.groupby("Vendor", as_index=False)["Purchases"]
-    .sum()
-    .sort_values("Purchases", ascending=False)
-)
+year_totals_all = aggs["year_totals"]
+overall_vendor_totals = aggs["vendor_totals"]
 
 top_vendors_overall = overall_vendor_totals.head(top_n)["Vendor"].tolist()
-vendor_order_overall = top_vendors_overall[:]
+vendor_year = aggs["vendor_year"]
 
-totals_by_year_vendor = (
-    data[data["Vendor"].isin(top_vendors_overall)]
-    .groupby(["Year", "Vendor"], as_index=False)["Purchases"]
-    .sum()
-)
+
+# -------------------------
+# Figures (cached as JSON, shared by the charts and the HTML downloads)
+# -------------------------
+@st.cache_data(show_spinner=False)
+def build_figures(
+    _vendor_stats_year: pd.DataFrame,
+    _year_totals_all: pd.DataFrame,
+    data_version: tuple,
+    year: str,
+    top_n: int,
+) -> dict:
+    # Stats arrive ranked by Purchases, so one head() slice feeds every Top-N chart
+    top_df = _vendor_stats_year.head(top_n)
+    top_vendors_year = top_df["Vendor"].tolist()
+
+    # Row 1 left: spend share (Top vendors) for selected year
+    pie_values = top_df["Purchases"].to_numpy()
+
+    # go traces directly: these are fixed-shape charts, so Plotly Express's frame introspection buys nothing
+    fig_pie = go.Figure(
+        go.Pie(
+            labels=top_df["Vendor"].to_numpy(),
+            values=pie_values,
+            hole=0.45,
+            sort=False,
+            direction="clockwise",
+            pull=pull_largest(pie_values),
+            marker=dict(line=dict(color="white", width=2)),
+            textinfo="percent",
+            textfont=dict(size=14, family="Arial Black", color="white"),
+            hovertemplate="Vendor=%{label}<br>Purchases=%{value}<extra></extra>",
+        ),
+        layout=dict(template=TEMPLATE),
+    )
+    fig_pie.update_layout(
+        title=f"Spend Share by Vendor — {year} (Top {top_n})",
+        legend=dict(orientation="v", x=1.02, y=1, xanchor="left", yanchor="top"),
+        margin=dict(r=140),
+    )
+
+    # Row 1 right: total purchases share by year
+    year_values = _year_totals_all["Purchases"].to_numpy()
+
+    fig_year_donut = go.Figure(
+        go.Pie(
+            labels=_year_totals_all["Year"].to_numpy(),
+            values=year_values,
+            hole=0.50,
+            sort=False,
+            direction="clockwise",
+            pull=pull_largest(year_values),
+            marker=dict(line=dict(color="white", width=2)),
+            textinfo="percent+label",
+            textfont=dict(size=14, family="Arial Black", color="white"),
+            hovertemplate="Year=%{label}<br>Purchases=%{value}<extra></extra>",
+        ),
+        layout=dict(template=TEMPLATE),
+    )
+    fig_year_donut.update_layout(title="Total Purchases Share by Year (2023–2025)")
+
+    # Row 2 left: Top vendors ranking
+    rank_df = top_df.iloc[::-1]
+
+    fig_rank = go.Figure(
+        go.Bar(
+            x=rank_df["Purchases"].to_numpy(),
+            y=rank_df["Vendor"].to_numpy(),
+            orientation="h",
+            hovertemplate="Purchases=%{x:,.0f}<br>Vendor=%{y}<extra></extra>",
+        ),
+        layout=dict(template=TEMPLATE),
+    )
+    fig_rank.update_layout(
+        title=f"Top {top_n} Vendors by Purchases — {year}",
+        xaxis_title="Purchases",
+        yaxis=dict(title="Vendor", categoryorder="array", categoryarray=top_vendors_year, autorange="reversed"),
+        margin=dict(l=10, r=10, t=60, b=10),
+    )
+
+    # Row 2 right: average monthly spend
+    # AvgMonthly is Purchases over a fixed month count, so it ranks exactly like Purchases
+    avg_top = top_df.iloc[::-1]
+
+    fig_avg_monthly = go.Figure(
+        go.Bar(
+            x=avg_top["AvgMonthly"].to_numpy(),
+            y=avg_top["Vendor"].to_numpy(),
+            orientation="h",
+            hovertemplate="AvgMonthly=%{x:,.0f}<br>Vendor=%{y}<extra></extra>",
+        ),
+        layout=dict(template=TEMPLATE),
+    )
+    fig_avg_monthly.update_layout(
+        title=f"Average Monthly Spend by Vendor — {year} (Top {top_n})",
+        xaxis_title="Avg Monthly Purchases",
+        yaxis=dict(title="Vendor", categoryorder="array", categoryarray=top_vendors_year, autorange="reversed"),
+        margin=dict(l=10, r=10, t=60, b=10),
+    )
+
+    return {
+        "vendor_share": pio.to_json(fig_pie, pretty=False, engine="orjson"),
+        "year_share": pio.to_json(fig_year_donut, pretty=False, engine="orjson"),
+        "rank": pio.to_json(fig_rank, pretty=False, engine="orjson"),
+        "avg_monthly": pio.to_json(fig_avg_monthly, pretty=False, engine="orjson"),
+    }
+
+
+@st.cache_data(show_spinner=False)
+def build_year_sections(
+    _vendor_year: pd.DataFrame,
+    _top_vendors_overall: list,
+    data_version: tuple,
+    top_n: int,
+) -> str:
+    # Row 4 doesn't depend on the selected year: keyed on (data_version, top_n) only,
+    # so changing the year reuses it. Year comparison grouped bars (Top N overall)
+
+    # Match on category codes: an integer scan instead of hashing every vendor name
+    vendor_cat = _vendor_year["Vendor"].cat
+    top_codes = vendor_cat.categories.get_indexer(_top_vendors_overall)
+    totals_by_year_vendor = _vendor_year[np.isin(vendor_cat.codes.to_numpy(), top_codes)]
+
+    fig_year_sections = go.Figure(layout=dict(template=TEMPLATE))
+    # One grouping pass, then traces in ranking order (instead of a row mask per vendor)
+    by_vendor = dict(tuple(totals_by_year_vendor.groupby("Vendor", observed=True, sort=False)))
+    for vendor in _top_vendors_overall:
+        g = by_vendor[vendor]
+        fig_year_sections.add_trace(go.Bar(
+            x=g["Year"].to_numpy(),
+            y=g["Purchases"].to_numpy(),
+            name=vendor,
+            legendgroup=vendor,
+            offsetgroup=vendor,
+            hovertemplate=f"Vendor={vendor}<br>Year=%{{x}}<br>Purchases=%{{y:,.0f}}<extra></extra>",
+        ))
+    fig_year_sections.update_layout(
+        title=f"Total Purchases by Vendor for Each Year (Top {top_n} overall)",
+        barmode="group",
+        xaxis=dict(categoryorder="array", categoryarray=YEAR_ORDER),
+        xaxis_title="Year",
+        yaxis_title="Total Purchases",
+        legend_title="Vendor",
+        bargap=0.25,
+        bargroupgap=0.08,
+        legend=dict(x=1.02, y=1, xanchor="left", yanchor="top"),
+        margin=dict(r=180),
+    )
+
+    return pio.to_json(fig_year_sections, pretty=False, engine="orjson")
+
+
+fig_json = {
+    **build_figures(vendor_stats_year, year_totals_all, data_version, selected_year, top_n),
+    "year_sections": build_year_sections(vendor_year, top_vendors_overall, data_version, top_n),
+}
 
 # -------------------------
 # KPI row
@@ -145,52 +352,10 @@ st.divider()
 p1, p2 = st.columns([1, 1], gap="large")
 
 with p1:
-    pie_df = vendor_totals_year.head(top_n).copy().sort_values("Purchases", ascending=False)
-    pie_df["Pull"] = 0.0
-    if not pie_df.empty:
-        pie_df.loc[pie_df["Purchases"].idxmax(), "Pull"] = 0.12
-
-    fig_pie = px.pie(
-        pie_df,
-        names="Vendor",
-        values="Purchases",
-        hole=0.45,
-        title=f"Spend Share by Vendor — {selected_year} (Top {top_n})",
-        category_orders={"Vendor": vendor_order_year},
-    )
-    fig_pie.update_traces(
-        pull=pie_df["Pull"],
-        marker=dict(line=dict(color="white", width=2)),
-        textinfo="percent",
-        textfont=dict(size=14, family="Arial Black", color="white"),
-    )
-    fig_pie.update_layout(
-        legend=dict(orientation="v", x=1.02, y=1, xanchor="left", yanchor="top"),
-        margin=dict(r=140),
-    )
-    st.plotly_chart(fig_pie, use_container_width=True)
+    st.plotly_chart(pio.from_json(fig_json["vendor_share"]), use_container_width=True)
 
 with p2:
-    year_totals_sorted = year_totals_all.copy()
-    year_totals_sorted["Pull"] = 0.0
-    if not year_totals_sorted.empty:
-        year_totals_sorted.loc[year_totals_sorted["Purchases"].idxmax(), "Pull"] = 0.12
-
-    fig_year_donut = px.pie(
-        year_totals_sorted,
-        names="Year",
-        values="Purchases",
-        hole=0.50,
-        title="Total Purchases Share by Year (2023–2025)",
-        category_orders={"Year": YEAR_ORDER},
-    )
-    fig_year_donut.update_traces(
-        pull=year_totals_sorted["Pull"],
-        marker=dict(line=dict(color="white", width=2)),
-        textinfo="percent+label",
-        textfont=dict(size=14, family="Arial Black", color="white"),
-    )
-    st.plotly_chart(fig_year_donut, use_container_width=True)
+    st.plotly_chart(pio.from_json(fig_json["year_share"]), use_container_width=True)
 
 st.divider()
 
@@ -200,52 +365,10 @@ st.divider()
 p3, p4 = st.columns([1,1], gap = "large")
 
 with p3:
-
-    rank_df = vendor_totals_year.head(top_n).sort_values("Purchases", ascending=True)
-
-    fig_rank = px.bar(
-        rank_df,
-        x="Purchases",
-        y="Vendor",
-        orientation="h",
-        title=f"Top {top_n} Vendors by Purchases — {selected_year}",
-        hover_data={"Purchases": ":,.0f"},
-        category_orders={"Vendor": rank_df["Vendor"].tolist()},
-    )
-    fig_rank.update_layout(
-        xaxis_title="Purchases",
-        yaxis_title="Vendor",
-        margin=dict(l=10, r=10, t=60, b=10),
-    )
-    fig_rank.update_yaxes(autorange="reversed")
-    st.plotly_chart(fig_rank, use_container_width=True)
+    st.plotly_chart(pio.from_json(fig_json["rank"]), use_container_width=True)
 
 with p4:
-    
-    avg_monthly_vendor = (
-        year_df.groupby("Vendor", as_index=False)["Purchases"].mean()
-        .rename(columns={"Purchases": "AvgMonthly"})
-        .sort_values("AvgMonthly", ascending=False)
-    )
-    avg_top = avg_monthly_vendor[avg_monthly_vendor["Vendor"].isin(top_vendors_year)]
-    avg_top = avg_top.sort_values("AvgMonthly", ascending=True)
-
-    fig_avg_monthly = px.bar(
-        avg_top,
-        x="AvgMonthly",
-        y="Vendor",
-        orientation="h",
-        title=f"Average Monthly Spend by Vendor — {selected_year} (Top {top_n})",
-        hover_data={"AvgMonthly": ":,.0f"},
-        category_orders={"Vendor": avg_top["Vendor"].tolist()},
-    )
-    fig_avg_monthly.update_yaxes(autorange="reversed")
-    fig_avg_monthly.update_layout(
-        xaxis_title="Avg Monthly Purchases",
-        yaxis_title="Vendor",
-        margin=dict(l=10, r=10, t=60, b=10),
-    )
-    st.plotly_chart(fig_avg_monthly, use_container_width=True)
+    st.plotly_chart(pio.from_json(fig_json["avg_monthly"]), use_container_width=True)
 
 
 st.divider()
@@ -254,26 +377,7 @@ st.divider()
 # ==========================================================
 # Row 4: Year comparison grouped bars (Top N overall)
 # ==========================================================
-fig_year_sections = px.bar(
-    totals_by_year_vendor,
-    x="Year",
-    y="Purchases",
-    color="Vendor",
-    barmode="group",
-    title=f"Total Purchases by Vendor for Each Year (Top {top_n} overall)",
-    hover_data={"Purchases": ":,.0f"},
-    category_orders={"Year": YEAR_ORDER, "Vendor": vendor_order_overall},
-)
-fig_year_sections.update_layout(
-    xaxis_title="Year",
-    yaxis_title="Total Purchases",
-    legend_title="Vendor",
-    bargap=0.25,
-    bargroupgap=0.08,
-    legend=dict(x=1.02, y=1, xanchor="left", yanchor="top"),
-    margin=dict(r=180),
-)
-st.plotly_chart(fig_year_sections, use_container_width=True)
+st.plotly_chart(pio.from_json(fig_json["year_sections"]), use_container_width=True)
 
 st.divider()
 
@@ -283,14 +387,6 @@ st.divider()
 if enable_downloads:
     st.subheader("Downloads (HTML only)")
 
-    fig_json = {
-        "vendor_share": fig_pie.to_json(),
-        "year_share": fig_year_donut.to_json(),
-        "rank": fig_rank.to_json(),
-        "avg_monthly": fig_avg_monthly.to_json(),
-        "year_sections": fig_year_sections.to_json(),
-    }
-
     d1, d2, d3 = st.columns(3)
 
     with d1:
@@ -322,12 +418,6 @@ if enable_downloads:
         )
 
     with d3:
-        st.download_button(
-            "Variability (HTML)",
-            data=fig_to_html_bytes(fig_json["variability"]),
-            file_name=f"purchases_variability_{selected_year}_top{top_n}.html",
-            mime="text/html",
-        )
         st.download_button(
             "Year Comparison (HTML)",
             data=fig_to_html_bytes(fig_json["year_sections"]),
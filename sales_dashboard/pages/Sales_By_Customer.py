@@ -1,22 +1,16 @@
-from pathlib import Path
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 import plotly.io as pio
 import streamlit as st
 
+from data import DATA_DIR, MONTH_ORDER, YEAR_ORDER, cached_parquet, candidate_encodings, fig_to_html_bytes
+
 st.set_page_config(page_title="Sales by Customer", layout="wide")
 
 # Theme (try: "plotly_white", "seaborn", "ggplot2", "simple_white")
 px.defaults.template = "seaborn"
 
-MONTH_ORDER = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
-YEAR_ORDER = ["2023", "2024", "2025"]
-
-BASE_DIR = Path(__file__).resolve().parent.parent  # .../sales_dashboard
-DATA_DIR = BASE_DIR / "sales_dashboard"
-if not DATA_DIR.exists():
-    DATA_DIR = BASE_DIR  # fallback: same folder as main app
-
 PATHS = {
     "2023": DATA_DIR / "AFC SALES BY CUSTOMER SUMMARY 2023.CSV",
     "2024": DATA_DIR / "AFC SALES BY CUSTOMER SUMMARY 2024.CSV",
@@ -32,40 +26,26 @@ CHLA_ALIASES = {
 }
 
 def read_csv_safe(path):
-    for enc in ("utf-8", "utf-8-sig", "cp1252", "latin1"):
+    # Normally a single parse: the first candidate is the sniffed encoding
+    encodings = candidate_encodings(path)
+    for enc in encodings:
         try:
-            return pd.read_csv(path, encoding=enc)
+            return pd.read_csv(path, encoding=enc, engine="c")
         except UnicodeDecodeError:
             continue
-    st.error(f"Could not decode file: {path}\nTried utf-8, utf-8-sig, cp1252, latin1.")
+    st.error(f"Could not decode file: {path}\nTried {', '.join(encodings)}.")
     st.stop()
 
-@st.cache_data(show_spinner=False)
-def fig_to_html_bytes(fig_json: str) -> bytes:
-    fig = pio.from_json(fig_json)
-    return fig.to_html(include_plotlyjs="cdn").encode("utf-8")
-
-@st.cache_data(show_spinner=False)
-def load_customer_sales_long(paths: dict) -> pd.DataFrame:
-    dfs = []
+def _build_customer_sales_long(paths: dict) -> pd.DataFrame:
+    wide_parts = []
+    long_parts = []
 
     for year, path in paths.items():
         df = read_csv_safe(path)
 
         # Rename first col to Customer
         df = df.rename(columns={df.columns[0]: "Customer"})
-
-        # Normalize customer names (CHLA rollup)
-        df["Customer"] = (
-            df["Customer"]
-            .astype(str)
-            .str.strip()
-            .replace(CHLA_ALIASES)
-        )
-
-        # Drop TOTAL row if present
-        df = df[df["Customer"].astype(str).str.upper() != "TOTAL"]
-        df["Customer"] = df["Customer"].astype(str).str.strip()
+        df["Year"] = str(year)
 
         # If already long-ish (Month + Sales columns)
         cols_lower = {c.lower(): c for c in df.columns}
@@ -73,46 +53,54 @@ def load_customer_sales_long(paths: dict) -> pd.DataFrame:
             month_col = cols_lower["month"]
             val_col = cols_lower.get("sales") or cols_lower.get("amount")
 
-            long_df = df.rename(columns={month_col: "Month", val_col: "Sales"})[
-                ["Customer", "Month", "Sales"]
-            ].copy()
+            long_parts.append(
+                df.rename(columns={month_col: "Month", val_col: "Sales"})[["Customer", "Year", "Month", "Sales"]]
+            )
+            continue
 
-            long_df["Month"] = long_df["Month"].astype(str).str[:3]
-            long_df["Month"] = pd.Categorical(long_df["Month"], categories=MONTH_ORDER, ordered=True)
-            long_df["Sales"] = pd.to_numeric(long_df["Sales"], errors="coerce").fillna(0)
-            long_df["Year"] = str(year)
+        # Otherwise assume wide format. Month headers carry the year ("Jan 23"),
+        # so key them by month alone and stack all years before a single melt.
+        month_cols = [c for c in df.columns if c not in ["Customer", "Year", "TOTAL", "Total", "total"]]
+        wide_parts.append(
+            df[["Customer", "Year", *month_cols]].rename(columns={c: str(c)[:3] for c in month_cols})
+        )
 
-            dfs.append(long_df)
-            continue
+    if wide_parts:
+        wide = pd.concat(wide_parts, ignore_index=True)
+        long_parts.append(wide.melt(id_vars=["Customer", "Year"], var_name="Month", value_name="Sales"))
 
-        # Otherwise assume wide format
-        month_cols = [c for c in df.columns if c not in ["Customer", "TOTAL", "Total", "total"]]
+    data = pd.concat(long_parts, ignore_index=True)
 
-        long_df = df.melt(
-            id_vars="Customer",
-            value_vars=month_cols,
-            var_name="Month",
-            value_name="Sales",
-        )
+    # Normalize customer names (CHLA rollup) and drop the TOTAL row, once for all years
+    cust = data["Customer"].astype(str).str.strip()
+    data["Customer"] = cust.map(CHLA_ALIASES).fillna(cust)
+    data = data[data["Customer"].str.upper() != "TOTAL"]
+    data["Customer"] = data["Customer"].str.strip()
 
-        long_df["Month"] = long_df["Month"].astype(str).str[:3]
-        long_df["Month"] = pd.Categorical(long_df["Month"], categories=MONTH_ORDER, ordered=True)
-        long_df["Sales"] = pd.to_numeric(long_df["Sales"], errors="coerce").fillna(0)
-        long_df["Year"] = str(year)
+    data["Month"] = pd.Categorical(data["Month"].astype(str).str[:3], categories=MONTH_ORDER, ordered=True)
+    data["Sales"] = pd.to_numeric(data["Sales"], errors="coerce").fillna(0)
 
-        dfs.append(long_df)
+    data = data[data["Customer"] != ""][["Customer", "Month", "Sales", "Year"]]
 
-    data = pd.concat(dfs, ignore_index=True)
-    data = data[data["Customer"] != ""]
+    # Few distinct customers/years: categorical codes make the page groupbys cheap
+    data["Customer"] = data["Customer"].astype("category")
+    data["Year"] = data["Year"].astype("category")
     return data
 
-data = load_customer_sales_long(PATHS)
+@st.cache_data(show_spinner=False)
+def load_customer_sales_long(paths: dict, mtimes: tuple) -> pd.DataFrame:
+    # mtimes only invalidates the cache when a CSV changes
+    # Bump the trailing version if the parsing above changes, so stale parquet is ignored
+    return cached_parquet(paths.values(), lambda: _build_customer_sales_long(paths), "customer_sales_long", 3)
+
+data_version = tuple(p.stat().st_mtime for p in PATHS.values())
+data = load_customer_sales_long(PATHS, data_version)
 
 # -------------------------
 # Sidebar filters
 # -------------------------
 st.sidebar.header("Filters")
-available_years = [y for y in YEAR_ORDER if y in set(data["Year"].unique())]
+available_years = [y for y in YEAR_ORDER if y in data["Year"].cat.categories]  # Year is categorical (see loader)
 selected_year = st.sidebar.selectbox("Year", available_years, index=len(available_years)-1)
 
 top_n = st.sidebar.slider("Top N customers", 5, 50, 15)
@@ -124,68 +112,79 @@ enable_downloads = st.sidebar.toggle("Enable downloads (HTML only)", value=False
 st.title("Sales by Customer (2023–2025)")
 st.caption("High-level view: top customers, concentration, and year-over-year comparison.")
 
-year_df = data[data["Year"] == selected_year].copy()
+# -------------------------
+# Aggregates (cached; the frame itself is never hashed, data_version stands in for it)
+# -------------------------
+@st.cache_data(show_spinner=False)
+def aggregates_global(_data: pd.DataFrame, data_version: tuple) -> dict:
+    # Independent of the sidebar, so only recomputed when a CSV changes
+    return {
+        "year_totals_all": _data.groupby("Year", as_index=False, observed=True)["Sales"].sum(),
+        "customer_totals": _data.groupby("Customer", observed=True)["Sales"].sum(),
+        "year_customer_totals": _data.groupby(["Year", "Customer"], as_index=False, observed=True)["Sales"].sum(),
+    }
 
-customer_totals_year = (
-    year_df.groupby("Customer", as_index=False)["Sales"]
-    .sum()
-    .sort_values("Sales", ascending=False)
-)
 
-total_year = customer_totals_year["Sales"].sum()
-top_customer = customer_totals_year.iloc[0]["Customer"] if len(customer_totals_year) else "—"
-top_customer_amt = customer_totals_year.iloc[0]["Sales"] if len(customer_totals_year) else 0
-top_customer_share = (top_customer_amt / total_year * 100) if total_year else 0
-active_customers = year_df["Customer"].nunique()
+@st.cache_data(show_spinner=False)
+def aggregates_topn(_data: pd.DataFrame, data_version: tuple, year: str, top_n: int) -> dict:
+    global_aggs = aggregates_global(_data, data_version)
+    year_df = _data[_data["Year"] == year]
+
+    customer_totals_year = (
+        year_df.groupby("Customer", as_index=False, observed=True)["Sales"]
+        .sum()
+        .sort_values("Sales", ascending=False)
+    )
 
-year_totals_all = data.groupby("Year", as_index=False)["Sales"].sum()
+    # Only the Top N overall are used, so select them without sorting every customer
+    top_customers_overall = global_aggs["customer_totals"].nlargest(top_n).index.tolist()
 
-overall_customer_totals = (
-    data.groupby("Customer", as_index=False)["Sales"]
-    .sum()
-    .sort_values("Sales", ascending=False)
-)
+    year_customer_totals = global_aggs["year_customer_totals"]
+    totals_by_year_customer = year_customer_totals[year_customer_totals["Customer"].isin(top_customers_overall)]
 
-top_customers_overall = overall_customer_totals.head(top_n)["Customer"].tolist()
+    return {
+        "customer_totals_year": customer_totals_year,
+        "active_customers": year_df["Customer"].nunique(),
+        "totals_by_year_customer": totals_by_year_customer,
+    }
 
-totals_by_year_customer = (
-    data[data["Customer"].isin(top_customers_overall)]
-    .groupby(["Year", "Customer"], as_index=False)["Sales"]
-    .sum()
-)
 
-# -------------------------
-# KPI row
-# -------------------------
-k1, k2, k3 = st.columns(3)
-k1.metric("Top Customer", top_customer)
-k2.metric("Top Customer Share", f"{top_customer_share:.1f}%")
-k3.metric("Active Customers", f"{active_customers:,}")
+global_aggs = aggregates_global(data, data_version)
+aggs = aggregates_topn(data, data_version, selected_year, top_n)
 
-st.divider()
+customer_totals_year = aggs["customer_totals_year"]
+totals_by_year_customer = aggs["totals_by_year_customer"]
+year_totals_all = global_aggs["year_totals_all"]
 
-# -------------------------
-# Pie charts
-# -------------------------
-p1, p2 = st.columns([1, 1], gap="large")
+total_year = customer_totals_year["Sales"].sum()
+top_customer = customer_totals_year.iloc[0]["Customer"] if len(customer_totals_year) else "—"
+top_customer_amt = customer_totals_year.iloc[0]["Sales"] if len(customer_totals_year) else 0
+top_customer_share = (top_customer_amt / total_year * 100) if total_year else 0
+active_customers = aggs["active_customers"]
 
-with p1:
-    st.caption(
-        "Shows how concentrated sales are across your biggest accounts for the selected year. "
-        "Each slice is one customer (Top N), and the largest slice is highlighted."
-    )
 
-    pie_df = customer_totals_year.head(top_n).copy().sort_values("Sales", ascending=False)
-    pie_df["Pull"] = 0.0
-    if not pie_df.empty:
-        pie_df.loc[pie_df["Sales"].idxmax(), "Pull"] = 0.12
+# -------------------------
+# Figures (cached as JSON, shared by the charts and the HTML downloads)
+# -------------------------
+@st.cache_data(show_spinner=False)
+def build_figures(
+    _customer_totals_year: pd.DataFrame,
+    _year_totals_all: pd.DataFrame,
+    _totals_by_year_customer: pd.DataFrame,
+    data_version: tuple,
+    year: str,
+    top_n: int,
+) -> dict:
+    # Explode only the largest slice
+    pie_df = _customer_totals_year.head(top_n).sort_values("Sales", ascending=False)
+    pie_df = pie_df.assign(Pull=(pie_df.index == pie_df["Sales"].idxmax()) * 0.12 if len(pie_df) else 0.0)
 
     fig_share_customers = px.pie(
         pie_df,
         names="Customer",
         values="Sales",
         hole=0.45,
-        title=f"Sales Share by Customer — {selected_year} (Top {top_n})",
+        title=f"Sales Share by Customer — {year} (Top {top_n})",
     )
     fig_share_customers.update_traces(
         pull=pie_df["Pull"],
@@ -196,19 +195,11 @@ with p1:
         legend=dict(orientation="v", x=1.02, y=1, xanchor="left", yanchor="top"),
         margin=dict(r=160),
     )
-    st.plotly_chart(fig_share_customers, use_container_width=True)
 
-with p2:
-    st.caption(
-        "Compares total sales by year (2023–2025). Useful for quickly seeing which year contributed "
-        "the largest share of total revenue."
+    year_totals_sorted = _year_totals_all.assign(
+        Pull=(_year_totals_all.index == _year_totals_all["Sales"].idxmax()) * 0.12 if len(_year_totals_all) else 0.0
     )
 
-    year_totals_sorted = year_totals_all.copy()
-    year_totals_sorted["Pull"] = 0.0
-    if not year_totals_sorted.empty:
-        year_totals_sorted.loc[year_totals_sorted["Sales"].idxmax(), "Pull"] = 0.12
-
     fig_year_share = px.pie(
         year_totals_sorted,
         names="Year",
@@ -222,7 +213,117 @@ with p2:
         marker=dict(line=dict(color="white", width=2)),
         textinfo="percent+label",
     )
-    st.plotly_chart(fig_year_share, use_container_width=True)
+
+    rank_df = _customer_totals_year.head(top_n).sort_values("Sales", ascending=True)
+
+    fig_top10 = px.bar(
+        rank_df,
+        x="Sales",
+        y="Customer",
+        orientation="h",
+        title=f"Top {top_n} Customers — {year}",
+        hover_data={"Sales": ":,.0f"},
+        category_orders={"Customer": rank_df["Customer"].tolist()},
+    )
+    fig_top10.update_yaxes(autorange="reversed")
+    fig_top10.update_layout(margin=dict(l=10, r=10, t=60, b=10))
+
+    fig_year_sections = go.Figure(layout=dict(template=px.defaults.template, margin=dict(t=60)))
+    for customer in _totals_by_year_customer["Customer"].unique():
+        g = _totals_by_year_customer[_totals_by_year_customer["Customer"] == customer]
+        fig_year_sections.add_trace(go.Bar(
+            x=g["Year"].to_numpy(),
+            y=g["Sales"].to_numpy(),
+            name=customer,
+            legendgroup=customer,
+            offsetgroup=customer,
+            hovertemplate=f"Customer={customer}<br>Year=%{{x}}<br>Sales=%{{y:,.0f}}<extra></extra>",
+        ))
+    fig_year_sections.update_layout(
+        title=f"Total Sales by Customer for Each Year (Top {top_n} overall)",
+        barmode="group",
+        xaxis=dict(categoryorder="array", categoryarray=YEAR_ORDER),
+        xaxis_title="Year",
+        yaxis_title="Total Sales",
+        legend_title="Customer",
+        bargap=0.25,
+        bargroupgap=0.08,
+        legend=dict(x=1.02, y=1, xanchor="left", yanchor="top"),
+        margin=dict(r=220),
+    )
+
+    return {
+        "share_customers": pio.to_json(fig_share_customers, pretty=False, engine="orjson"),
+        "year_share": pio.to_json(fig_year_share, pretty=False, engine="orjson"),
+        "top10": pio.to_json(fig_top10, pretty=False, engine="orjson"),
+        "year_sections": pio.to_json(fig_year_sections, pretty=False, engine="orjson"),
+    }
+
+
+@st.cache_data(show_spinner=False)
+def build_yoy_figure(_data: pd.DataFrame, data_version: tuple) -> str:
+    # Only built when the YoY chart is opened or downloaded
+    monthly_yoy = _data.groupby(["Year", "Month"], as_index=False, observed=True)["Sales"].sum()
+
+    # Built from go traces directly: px re-validates the whole frame on every rerun
+    fig_yoy_monthly = go.Figure(layout=dict(template=px.defaults.template, margin=dict(t=60)))
+    for y in YEAR_ORDER:
+        g = monthly_yoy[monthly_yoy["Year"] == y]
+        if g.empty:
+            continue
+        fig_yoy_monthly.add_trace(go.Scatter(
+            x=g["Month"].astype(str).to_numpy(),
+            y=g["Sales"].to_numpy(),
+            name=y,
+            legendgroup=y,
+            mode="lines+markers",
+            hovertemplate=f"Year={y}<br>Month=%{{x}}<br>Sales=%{{y:,.0f}}<extra></extra>",
+        ))
+
+    fig_yoy_monthly.update_layout(
+        title="Monthly Total Sales — Year-over-Year (2023–2025)",
+        xaxis=dict(categoryorder="array", categoryarray=MONTH_ORDER),
+        xaxis_title="Month",
+        yaxis_title="Sales",
+        legend_title="Year",
+    )
+
+    return pio.to_json(fig_yoy_monthly, pretty=False, engine="orjson")
+
+
+fig_json = build_figures(
+    customer_totals_year, year_totals_all, totals_by_year_customer,
+    data_version, selected_year, top_n,
+)
+
+# -------------------------
+# KPI row
+# -------------------------
+k1, k2, k3 = st.columns(3)
+k1.metric("Top Customer", top_customer)
+k2.metric("Top Customer Share", f"{top_customer_share:.1f}%")
+k3.metric("Active Customers", f"{active_customers:,}")
+
+st.divider()
+
+# -------------------------
+# Pie charts
+# -------------------------
+p1, p2 = st.columns([1, 1], gap="large")
+
+with p1:
+    st.caption(
+        "Shows how concentrated sales are across your biggest accounts for the selected year. "
+        "Each slice is one customer (Top N), and the largest slice is highlighted."
+    )
+    st.plotly_chart(pio.from_json(fig_json["share_customers"]), use_container_width=True)
+
+with p2:
+    st.caption(
+        "Compares total sales by year (2023–2025). Useful for quickly seeing which year contributed "
+        "the largest share of total revenue."
+    )
+    st.plotly_chart(pio.from_json(fig_json["year_share"]), use_container_width=True)
 
 st.divider()
 
@@ -235,55 +336,21 @@ st.caption(f"""
            """
 
 )
-
-top10 = top_n
-rank_df = customer_totals_year.head(top10).sort_values("Sales", ascending=True)
-
-fig_top10 = px.bar(
-    rank_df,
-    x="Sales",
-    y="Customer",
-    orientation="h",
-    title=f"Top {top10} Customers — {selected_year}",
-    hover_data={"Sales": ":,.0f"},
-    category_orders={"Customer": rank_df["Customer"].tolist()},
-)
-fig_top10.update_yaxes(autorange="reversed")
-fig_top10.update_layout(margin=dict(l=10, r=10, t=60, b=10))
-st.plotly_chart(fig_top10, use_container_width=True)
+st.plotly_chart(pio.from_json(fig_json["top10"]), use_container_width=True)
 
 st.divider()
 
 # -------------------------
 # Monthly YoY totals
 # -------------------------
-st.caption(
-    "Shows the monthly total sales trend for each year on the same chart. "
-    "This is useful for spotting seasonality and comparing year-over-year performance by month."
-)
-
-monthly_yoy = (
-    data.groupby(["Year", "Month"], as_index=False)["Sales"]
-    .sum()
-)
-
-fig_yoy_monthly = px.line(
-    monthly_yoy,
-    x="Month",
-    y="Sales",
-    color="Year",
-    markers=True,
-    title="Monthly Total Sales — Year-over-Year (2023–2025)",
-    hover_data={"Sales": ":,.0f"},
-    category_orders={"Month": MONTH_ORDER, "Year": YEAR_ORDER},
-)
-
-fig_yoy_monthly.update_layout(
-    xaxis_title="Month",
-    yaxis_title="Sales",
-    legend_title="Year",
-)
-st.plotly_chart(fig_yoy_monthly, use_container_width=True)
+# The expander body runs even when collapsed, so the chart is behind an explicit checkbox
+with st.expander("Monthly YoY trend", expanded=False):
+    st.caption(
+        "Shows the monthly total sales trend for each year on the same chart. "
+        "This is useful for spotting seasonality and comparing year-over-year performance by month."
+    )
+    if st.checkbox("Load chart", key="show_yoy"):
+        st.plotly_chart(pio.from_json(build_yoy_figure(data, data_version)), use_container_width=True)
 
 st.divider()
 
@@ -294,27 +361,7 @@ st.caption(
     "Compares total sales for the Top N customers (overall across 2023–2025) in each year. "
     "Great for seeing whether key accounts are growing, shrinking, or staying consistent year-to-year."
 )
-
-fig_year_sections = px.bar(
-    totals_by_year_customer,
-    x="Year",
-    y="Sales",
-    color="Customer",
-    barmode="group",
-    title=f"Total Sales by Customer for Each Year (Top {top_n} overall)",
-    hover_data={"Sales": ":,.0f"},
-    category_orders={"Year": YEAR_ORDER},
-)
-fig_year_sections.update_layout(
-    xaxis_title="Year",
-    yaxis_title="Total Sales",
-    legend_title="Customer",
-    bargap=0.25,
-    bargroupgap=0.08,
-    legend=dict(x=1.02, y=1, xanchor="left", yanchor="top"),
-    margin=dict(r=220),
-)
-st.plotly_chart(fig_year_sections, use_container_width=True)
+st.plotly_chart(pio.from_json(fig_json["year_sections"]), use_container_width=True)
 
 st.divider()
 
@@ -325,14 +372,6 @@ if enable_downloads:
     st.subheader("Downloads (HTML only)")
     st.caption("Download interactive versions of the charts as standalone HTML files.")
 
-    fig_json = {
-        "share_customers": fig_share_customers.to_json(),
-        "year_share": fig_year_share.to_json(),
-        "top10": fig_top10.to_json(),
-        "yoy_monthly": fig_yoy_monthly.to_json(),
-        "year_sections": fig_year_sections.to_json(),
-    }
-
     d1, d2, d3 = st.columns(3)
 
     with d1:
@@ -360,7 +399,7 @@ if enable_downloads:
     with d3:
         st.download_button(
             "YoY Monthly (HTML)",
-            data=fig_to_html_bytes(fig_json["yoy_monthly"]),
+            data=fig_to_html_bytes(build_yoy_figure(data, data_version)),
             file_name="monthly_yoy_2023_2025.html",
             mime="text/html",
         )
@@ -1,33 +1,34 @@
 import csv
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.io as pio
 import plotly.graph_objects as go
 import streamlit as st
 
+from data import DATA_DIR, MONTH_ORDER, YEAR_ORDER, cached_parquet, candidate_encodings, fig_to_html_bytes
+
 
 # -------------------------
 # Paths / Config
 # -------------------------
-BASE_DIR = Path(__file__).resolve().parent
-DATA_DIR = BASE_DIR.parent  # sales_dashboard root
-
 st.set_page_config(page_title="AFC Sales by Item (SKU)", layout="wide")
 
 # Match your global style
 px.defaults.template = "seaborn"
 
-MONTH_ORDER = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-YEAR_ORDER = ["2023", "2024", "2025"]
-
 FILES = {
     "2023": DATA_DIR / "AFC SALES BY ITEM SUMMARY 2023.CSV",
     "2024": DATA_DIR / "AFC SALES BY ITEM SUMMARY 2024.CSV",
     "2025": DATA_DIR / "AFC SALES BY ITEM SUMMARY 2025.CSV",
 }
 
+# Item prefixes hidden by the "Exclude Labor" toggle
+LABOR_PREFIXES = ("LABOR", "LABOR-PF", "LABOR-FF")
+
 # QuickBooks grouping / subtotal labels we do NOT want treated as SKUs
 GROUP_HEADERS_EXACT = {
     "uncategorized",
@@ -36,55 +37,39 @@ GROUP_HEADERS_EXACT = {
     "other charges",
 }
 
-def is_group_or_total_row(label: str) -> bool:
-    s = str(label or "").strip()
-    low = s.lower()
-
-    if not s:
-        return True
-
-    # Drop grouping buckets (like your screenshot)
-    if low in GROUP_HEADERS_EXACT:
-        return True
-
-    # Drop totals/subtotals
-    if low == "total" or low == "grand total":
-        return True
-    if low.startswith("total "):
-        return True
-    if "subtotal" in low:
-        return True
-
+# Exact labels (lowercased) that are never real SKU lines
+_DROP_LABELS = frozenset(GROUP_HEADERS_EXACT | {
+    "",
+    # Totals
+    "total",
+    "grand total",
     # Some QB exports add these
-    if low in {"items", "item", "name", "description"}:
-        return True
-
-    return False
+    "items",
+    "item",
+    "name",
+    "description",
+})
+
+
+def is_group_or_total_row(labels: pd.Series) -> pd.Series:
+    low = labels.fillna("").astype(str).str.strip().str.lower()
+    return (
+        low.isin(_DROP_LABELS)
+        | low.str.startswith("total ")
+        | low.str.contains("subtotal", regex=False)
+    )
 
 
 # -------------------------
-# Cached helper for HTML downloads
+# Parsing helpers (simple + robust)
 # -------------------------
-@st.cache_data(show_spinner=False)
-def fig_to_html_bytes(fig_json: str) -> bytes:
-    fig = pio.from_json(fig_json)
-    return fig.to_html(include_plotlyjs="cdn").encode("utf-8")
+_MONEY_TRANS = str.maketrans({"$": "", ",": "", "(": "-", ")": ""})
 
 
-# -------------------------
-# Parsing helpers (simple + robust)
-# -------------------------
-def _clean_money(x):
-    if x is None:
-        return 0.0
-    s = str(x).strip()
-    if s in ("", "-", "—"):
-        return 0.0
-    s = s.replace("$", "").replace(",", "").replace("(", "-").replace(")", "")
-    try:
-        return float(s)
-    except ValueError:
-        return 0.0
+def _clean_money(col: pd.Series) -> pd.Series:
+    s = col.fillna("").astype(str).str.translate(_MONEY_TRANS).str.strip()
+    # blanks, "-" and "—" (and anything else non-numeric) count as 0
+    return pd.to_numeric(s, errors="coerce").fillna(0.0)
 
 
 def _month3(x):
@@ -96,33 +81,12 @@ def _month3(x):
 
 
 
-@st.cache_data(show_spinner=False)
-def parse_qb_sales_by_item_summary(path: str, year: str) -> pd.DataFrame:
+@lru_cache(maxsize=32)
+def _build_column_map(header_month: tuple, header_metric: tuple) -> tuple:
     """
-    Minimal, robust parser for QuickBooks 'Sales by Item Summary' exports.
-    Extracts: Item | Year | Month | Qty | Amount
-    Uses csv.reader so ragged rows won't crash pandas.
-    Filters out QB grouping rows & total rows so you only get the real item lines.
+    Map each month to its Qty and Amount column indexes from the two QB header rows.
+    header_month is already reduced to _month3 labels, so every year shares one entry.
     """
-    rows = None
-    last_err = None
-
-    for enc in ("utf-8", "utf-8-sig", "cp1252", "latin1"):
-        try:
-            with open(path, "r", encoding=enc, newline="") as f:
-                rows = list(csv.reader(f))
-            break
-        except Exception as e:
-            last_err = e
-            continue
-
-    if not rows or len(rows) < 3:
-        st.error(f"Could not read {Path(path).name}. Last error: {last_err}")
-        st.stop()
-
-    header_month = rows[0]
-    header_metric = rows[1]
-
     # map column -> month (carry forward)
     col_month = {}
     metric_len = len(header_metric)
@@ -166,28 +130,62 @@ def parse_qb_sales_by_item_summary(path: str, year: str) -> pd.DataFrame:
         elif is_amt(header_metric[c]):
             amt_col[m] = c
 
-    records = []
-    for r in rows[2:]:
-        if not r:
-            continue
-
-        item = r[0].strip() if len(r) > 0 else ""
+    return qty_col, amt_col
 
-        # Drop QB group headings / totals (this is the “umbrella” problem)
-        if is_group_or_total_row(item) or item.upper() == "TOTAL":
-            continue
 
-        for m in MONTH_ORDER:
-            qc = qty_col.get(m)
-            ac = amt_col.get(m)
+def _parse_qb_sales_by_item_summary(path: str, year: str) -> pd.DataFrame:
+    """
+    Minimal, robust parser for QuickBooks 'Sales by Item Summary' exports.
+    Extracts: Item | Year | Month | Qty | Amount
+    Uses csv.reader so ragged rows won't crash pandas.
+    Filters out QB grouping rows & total rows so you only get the real item lines.
+    """
+    rows = None
+    last_err = None
 
-            qty = _clean_money(r[qc]) if qc is not None and qc < len(r) else 0.0
-            amt = _clean_money(r[ac]) if ac is not None and ac < len(r) else 0.0
+    for enc in candidate_encodings(path):
+        try:
+            with open(path, "r", encoding=enc, newline="") as f:
+                rows = list(csv.reader(f))
+            break
+        except Exception as e:
+            last_err = e
+            continue
 
-            if qty != 0 or amt != 0:
-                records.append({"Item": item, "Year": year, "Month": m, "Qty": qty, "Amount": amt})
+    if not rows or len(rows) < 3:
+        st.error(f"Could not read {Path(path).name}. Last error: {last_err}")
+        st.stop()
 
-    df = pd.DataFrame(records)
+    # Month labels carry the year ("Jan 23"), so key the layout by month only
+    qty_col, amt_col = _build_column_map(tuple(_month3(c) for c in rows[0]), tuple(rows[1]))
+
+    # Ragged rows are padded with None, which _clean_money treats as 0
+    body = pd.DataFrame(rows[2:])
+    item = body[0].fillna("").str.strip()
+
+    # Drop QB group headings / totals (this is the “umbrella” problem)
+    keep = ~is_group_or_total_row(item)
+    body = body[keep]
+    item = item[keep]
+
+    def month_block(cols):
+        zero = pd.Series(0.0, index=body.index)
+        return pd.DataFrame({
+            m: _clean_money(body[cols[m]]) if cols.get(m) is not None and cols[m] in body else zero
+            for m in MONTH_ORDER
+        })
+
+    # Row-major (item, month) order like QB, so ties in Amount sort the same way
+    qty = month_block(qty_col).to_numpy().ravel()
+    amt = month_block(amt_col).to_numpy().ravel()
+    df = pd.DataFrame({
+        "Item": np.repeat(item.to_numpy(), len(MONTH_ORDER)),
+        "Year": year,
+        "Month": np.tile(MONTH_ORDER, len(item)),
+        "Qty": qty,
+        "Amount": amt,
+    })
+    df = df[(df["Qty"] != 0) | (df["Amount"] != 0)].reset_index(drop=True)
     if df.empty:
         return df
 
@@ -195,6 +193,30 @@ def parse_qb_sales_by_item_summary(path: str, year: str) -> pd.DataFrame:
     return df.sort_values(["Year", "Month", "Amount"], ascending=[True, True, False])
 
 
+def parse_qb_sales_by_item_summary(path: str, year: str) -> pd.DataFrame:
+    # Not st.cache_data: a (path, year) key would outlive CSV edits. load_item_sales is the
+    # mtime-keyed memory layer and cached_parquet re-keys the disk copy on mtime/size.
+    # Bump the trailing version if the parser changes, so stale parquet is ignored
+    return cached_parquet([path], lambda: _parse_qb_sales_by_item_summary(path, year), "qb_item_summary", year, 2)
+
+
+@st.cache_data(show_spinner=False)
+def load_item_sales(years: tuple, mtimes: tuple) -> pd.DataFrame:
+    # mtimes only invalidates the cache when a CSV changes
+    dfs = [parse_qb_sales_by_item_summary(str(FILES[y]), y) for y in years]
+    data = pd.concat([d for d in dfs if d is not None and not d.empty], ignore_index=True)
+    if data.empty:
+        return data
+
+    # Few distinct SKUs/years: categorical Item/Year, and the labor test is done once here
+    data["Item"] = data["Item"].astype("category")
+    data["Year"] = data["Year"].astype("category")
+    # String test on the (few) categories only, broadcast to rows through the codes
+    labor_cats = data["Item"].cat.categories.str.strip().str.upper().str.startswith(LABOR_PREFIXES)
+    data["_is_labor"] = np.asarray(labor_cats)[data["Item"].cat.codes.to_numpy()]
+    return data
+
+
 # -------------------------
 # Header
 # -------------------------
@@ -210,8 +232,8 @@ if not available_years:
     st.error("No 'Sales by Item Summary' CSVs found. Put the files in the sales_dashboard folder.")
     st.stop()
 
-dfs = [parse_qb_sales_by_item_summary(str(FILES[y]), y) for y in available_years]
-data = pd.concat([d for d in dfs if d is not None and not d.empty], ignore_index=True)
+data_version = tuple(FILES[y].stat().st_mtime for y in available_years)
+data = load_item_sales(tuple(available_years), data_version)
 
 
 
@@ -242,54 +264,64 @@ exclude_labor = st.sidebar.toggle("Exclude Labor from charts", value=False)
 # -------------------------
 # Selected-year slice
 # -------------------------
-year_df = data[data["Year"] == selected_year].copy()
-
-LABOR_ITEMS = {"LABOR (LABOR)","LABOR-PF (Pre Filter Removal/ Installation/ Disposal)"}
+year_df = data[data["Year"] == selected_year]
 
 if exclude_labor:
-    labor_prefixes = ("LABOR","LABOR-PF","LABOR-FF")
-    year_df = year_df[~year_df["Item"].astype(str).str.strip().str.upper().str.startswith(labor_prefixes)]
-
-data_view = data 
-if exclude_labor:
-    labor_prefixes = ("LABOR","LABOR-PF","LABOR-FF")
-    data_view = data_view[~data_view["Item"].astype(str).str.strip().str.upper().str.startswith(labor_prefixes)]
-    
-
-
-
+    year_df = year_df[~year_df["_is_labor"]]
 
 if year_df.empty:
     st.warning("No data matches your filters.")
     st.stop()
 
-# Totals by SKU (selected year)
-sku_totals = (
-    year_df.groupby("Item", as_index=False)["Amount"].sum()
-    .sort_values("Amount", ascending=False)
-)
-
-# Use Top N in monthly grouped chart
-top_items_year = sku_totals.head(top_n)["Item"]
-year_top_df = year_df[year_df["Item"].isin(top_items_year)].copy()
-
-# All-years monthly totals (for YoY line)
-all_year_monthly = (
-    data_view.groupby(["Year", "Month"], as_index=False)["Amount"].sum()
-    .sort_values(["Year", "Month"])
-)
 
+# -------------------------
+# Aggregates (cached; frames are never hashed, the scalar args stand in for them)
+# -------------------------
+@st.cache_data(show_spinner=False)
+def aggregates_global(_data: pd.DataFrame, data_version: tuple, exclude_labor: bool) -> dict:
+    # All-years views: only recomputed when a CSV or the labor toggle changes
+    data_view = _data[~_data["_is_labor"]] if exclude_labor else _data
+    return {
+        "item_totals": data_view.groupby("Item", as_index=False, observed=True)["Amount"].sum(),
+        "year_item_totals": data_view.groupby(["Year", "Item"], as_index=False, observed=True)["Amount"].sum(),
+    }
 
-overall_top_items = (
-    data_view.groupby("Item",as_index=False)["Amount"].sum()
-    .sort_values("Amount", ascending=False)
-    .head(top_n)["Item"]
-)
 
-comparison_by_item = (
-    data_view.groupby(["Year","Item"], as_index=False)["Amount"].sum()
-)
-comparison_by_item = comparison_by_item[comparison_by_item["Item"].isin(overall_top_items)]
+@st.cache_data(show_spinner=False)
+def aggregates_topn(
+    _year_df: pd.DataFrame,
+    _data: pd.DataFrame,
+    data_version: tuple,
+    year: str,
+    top_n: int,
+    exclude_labor: bool,
+) -> dict:
+    global_aggs = aggregates_global(_data, data_version, exclude_labor)
+
+    # Totals by SKU (selected year); only the leaders are shown, so no full sort
+    sku_totals_all = _year_df.groupby("Item", as_index=False, observed=True)["Amount"].sum()
+    sku_totals = sku_totals_all.nlargest(top_n, "Amount")
+
+    # Use Top N in monthly grouped chart
+    top_items_year = sku_totals["Item"]
+    year_top_df = _year_df[_year_df["Item"].isin(top_items_year)]
+
+    overall_top_items = global_aggs["item_totals"].nlargest(top_n, "Amount")["Item"]
+    comparison_by_item = global_aggs["year_item_totals"]
+    comparison_by_item = comparison_by_item[comparison_by_item["Item"].isin(overall_top_items)]
+
+    return {
+        "active_skus": int(sku_totals_all.shape[0]),
+        "sku_totals": sku_totals,
+        "year_top_df": year_top_df,
+        "comparison_by_item": comparison_by_item,
+    }
+
+
+aggs = aggregates_topn(year_df, data, data_version, selected_year, top_n, exclude_labor)
+sku_totals = aggs["sku_totals"]
+year_top_df = aggs["year_top_df"]
+comparison_by_item = aggs["comparison_by_item"]
 
 
 # -------------------------
@@ -299,12 +331,11 @@ k1, k2, k3, k4 = st.columns(4)
 
 selected_total = float(year_df["Amount"].sum())
 all_years_total = float(data["Amount"].sum())
-active_skus = int(sku_totals.shape[0])
+active_skus = aggs["active_skus"]
 
 top_sku_label = sku_totals.iloc[0]["Item"] if len(sku_totals) else "—"
 top_sku_sales = float(sku_totals.iloc[0]["Amount"]) if len(sku_totals) else 0.0
-top10_share = (float(sku_totals.head(10)["Amount"].sum()) / selected_total * 100.0) if selected_total else 0.0
-top_n_share = (float(sku_totals.head(top_n)["Amount"].sum()) / selected_total * 100.0) if selected_total else 0.0
+top_n_share = (float(sku_totals["Amount"].sum()) / selected_total * 100.0) if selected_total else 0.0
 
 
 
@@ -317,136 +348,147 @@ st.divider()
 
 
 # -------------------------
-# Build figures (6 max)
+# Build figures (cached as JSON, shared by the charts and the HTML downloads)
 # -------------------------
+@st.cache_data(show_spinner=False)
+def build_figures(
+    _year_top_df: pd.DataFrame,
+    _sku_totals: pd.DataFrame,
+    _comparison_by_item: pd.DataFrame,
+    data_version: tuple,
+    year: str,
+    top_n: int,
+    exclude_labor: bool,
+) -> dict:
+    # exclude_labor is in the key because every frame passed in is already labor-filtered
+
+    # Chart 1: Monthly grouped bars for Top N SKUs
+    monthly_grouped = (
+        _year_top_df.groupby(["Month", "Item"], as_index=False, observed=True)["Amount"].sum()
+    )
 
-# Chart 1: Monthly grouped bars for Top N SKUs
-monthly_grouped = (
-    year_top_df.groupby(["Month", "Item"], as_index=False)["Amount"].sum()
-)
-
-fig1 = px.bar(
-    monthly_grouped,
-    x="Month",
-    y="Amount",
-    color="Item",
-    barmode="group",
-    title=f"Monthly Sales by SKU — {selected_year} (Top {top_n})",
-    hover_data={"Amount": ":,.0f"},
-    category_orders={"Month": MONTH_ORDER},
-)
-fig1.update_layout(bargap=0.2, bargroupgap=0.05, legend_title="SKU")
-
-# Chart 2: Pie/Donut: Top N only (NO 'All Other')
-pie_df = (
-    sku_totals.head(top_n)
-    .rename(columns={"Amount": "Sales"})[["Item", "Sales"]]
-    .sort_values("Sales", ascending=False)
-)
-max_item = pie_df.iloc[0]["Item"] if len(pie_df) else ""
-pie_df["Pull"] = pie_df["Item"].apply(lambda x: 0.12 if x == max_item else 0.0)
-
-fig2 = px.pie(
-    pie_df,
-    names="Item",
-    values="Sales",
-    hole=0.55,
-    title=f"Sales Share — Top {top_n} SKUs ({selected_year})",
-)
-fig2.update_traces(
-    pull=pie_df["Pull"],
-    textinfo="percent+label",
-    marker=dict(line=dict(color="white", width=2)),
-)
-fig2.update_layout(
-    legend=dict(
-        orientation = "h",
-        yanchor="top",
-        y=-0.15,
-        xanchor="center",
-        x=0.5
-    ),
-    margin=dict(b=120)
-)
-
-# Chart 3: Top N SKUs by total (horizontal bar)
-top_bar = sku_totals.head(top_n).sort_values("Amount", ascending=True)
-fig3 = px.bar(
-    top_bar,
-    x="Amount",
-    y="Item",
-    orientation="h",
-    title=f"Top {top_n} SKUs by Total Sales — {selected_year}",
-    hover_data={"Amount": ":,.0f"},
-)
-fig3.update_layout(yaxis_title="SKU", xaxis_title="Sales")
+    # go traces straight from the grouped arrays (skips px's frame introspection)
+    fig1 = go.Figure(layout=dict(template=px.defaults.template, margin=dict(t=60)))
+    for item in sorted(_sku_totals["Item"]):
+        g = monthly_grouped[monthly_grouped["Item"] == item]
+        fig1.add_trace(go.Bar(
+            x=g["Month"].astype(str).to_numpy(),
+            y=g["Amount"].to_numpy(),
+            name=item,
+            legendgroup=item,
+            offsetgroup=item,
+            hovertemplate=f"Item={item}<br>Month=%{{x}}<br>Amount=%{{y:,.0f}}<extra></extra>",
+        ))
+    fig1.update_layout(
+        title=f"Monthly Sales by SKU — {year} (Top {top_n})",
+        barmode="group",
+        xaxis=dict(categoryorder="array", categoryarray=MONTH_ORDER),
+        xaxis_title="Month",
+        yaxis_title="Amount",
+        bargap=0.2,
+        bargroupgap=0.05,
+        legend_title="SKU",
+    )
 
+    # Chart 2: Pie/Donut: Top N only (NO 'All Other')
+    pie_df = (
+        _sku_totals
+        .rename(columns={"Amount": "Sales"})[["Item", "Sales"]]
+        .sort_values("Sales", ascending=False)
+    )
+    max_item = pie_df.iloc[0]["Item"] if len(pie_df) else ""
+    pie_df = pie_df.assign(Pull=(pie_df["Item"] == max_item) * 0.12)
+
+    fig2 = px.pie(
+        pie_df,
+        names="Item",
+        values="Sales",
+        hole=0.55,
+        title=f"Sales Share — Top {top_n} SKUs ({year})",
+    )
+    fig2.update_traces(
+        pull=pie_df["Pull"],
+        textinfo="percent+label",
+        marker=dict(line=dict(color="white", width=2)),
+    )
+    fig2.update_layout(
+        legend=dict(
+            orientation = "h",
+            yanchor="top",
+            y=-0.15,
+            xanchor="center",
+            x=0.5
+        ),
+        margin=dict(b=120)
+    )
 
+    # Chart 3: Top N SKUs by total (horizontal bar)
+    top_bar = _sku_totals.sort_values("Amount", ascending=True)
+    fig3 = px.bar(
+        top_bar,
+        x="Amount",
+        y="Item",
+        orientation="h",
+        title=f"Top {top_n} SKUs by Total Sales — {year}",
+        hover_data={"Amount": ":,.0f"},
+    )
+    fig3.update_layout(yaxis_title="SKU", xaxis_title="Sales")
+
+    # Chart 6: Top N items compared across years
+    fig6 = go.Figure(layout=dict(template=px.defaults.template, margin=dict(t=60)))
+    for item in _comparison_by_item["Item"].unique():
+        g = _comparison_by_item[_comparison_by_item["Item"] == item]
+        fig6.add_trace(go.Bar(
+            x=g["Year"].to_numpy(),
+            y=g["Amount"].to_numpy(),
+            name=item,
+            legendgroup=item,
+            offsetgroup=item,
+            hovertemplate=f"Item={item}<br>Year=%{{x}}<br>Amount=%{{y:,.0f}}<extra></extra>",
+        ))
+
+    fig6.update_layout(
+        title=f"Top {top_n} Items Compared Across Years ",
+        barmode="group",
+        xaxis=dict(categoryorder="array", categoryarray=YEAR_ORDER),
+        xaxis_title="Year",
+        yaxis_title="Totals Sales",
+        legend_title="Item",
+        legend=dict(
+            orientation = "h",
+            yanchor="top",
+            y=-0.15,
+            xanchor="center",
+            x=0.5
+        ),
+        margin=dict(b=120)
+    )
 
-# Chart 6: Core vs Long Tail (Top 5 SKUs vs All Other) for selected year
-top5_items = sku_totals.head(5)["Item"].tolist()
+    return {
+        "monthly_top": pio.to_json(fig1, pretty=False, engine="orjson"),
+        "share_topn": pio.to_json(fig2, pretty=False, engine="orjson"),
+        "top_skus": pio.to_json(fig3, pretty=False, engine="orjson"),
+        "compare_years": pio.to_json(fig6, pretty=False, engine="orjson"),
+    }
 
-top5_month = (
-    year_df[year_df["Item"].isin(top5_items)]
-    .groupby("Month", as_index=False)["Amount"].sum()
-    .rename(columns={"Amount": "Top 5"})
-)
-total_month = (
-    year_df.groupby("Month", as_index=False)["Amount"].sum()
-    .rename(columns={"Amount": "Total"})
-)
-mix = total_month.merge(top5_month, on="Month", how="left")
-mix["Top 5"] = mix["Top 5"].fillna(0.0)
-mix["All Other"] = mix["Total"] - mix["Top 5"]
-
-
-fig6 = px.bar(
-    comparison_by_item,
-    x="Year",
-    y="Amount",
-    color="Item",
-    barmode="group",
-    title=f"Top {top_n} Items Compared Across Years ",
-    hover_data={"Amount":":,.0f"},
-    category_orders={"Year":YEAR_ORDER}
-)
 
-fig6.update_layout(
-    xaxis_title="Year",
-    yaxis_title="Totals Sales",
-    legend=dict(
-        orientation = "h",
-        yanchor="top",
-        y=-0.15,
-        xanchor="center",
-        x=0.5
-    ),
-    margin=dict(b=120)
+fig_json = build_figures(
+    year_top_df, sku_totals, comparison_by_item,
+    data_version, selected_year, top_n, exclude_labor,
 )
 
 
-
-# JSON snapshots for cached HTML export
-fig_json = {
-    "monthly_top": fig1.to_json(),
-    "share_topn": fig2.to_json(),
-    "top_skus": fig3.to_json(),
-
-
-}
-
-
 # -------------------------
 # Layout (match your style)
 # -------------------------
 # Row 1: Monthly grouped bars + Donut
 
-st.plotly_chart(fig1, use_container_width=True)
+st.plotly_chart(pio.from_json(fig_json["monthly_top"]), use_container_width=True)
 
 st.divider()
 
 
-st.plotly_chart(fig2, use_container_width=True)
+st.plotly_chart(pio.from_json(fig_json["share_topn"]), use_container_width=True)
 
 
 st.divider()
@@ -454,13 +496,13 @@ st.divider()
 
 # Row 2: Top SKUs (barh) + Pareto
 
-st.plotly_chart(fig3, use_container_width=True)
+st.plotly_chart(pio.from_json(fig_json["top_skus"]), use_container_width=True)
 
 st.divider()
 
 # Row 3: YoY totals + Core vs Tail
 
-st.plotly_chart(fig6, use_container_width=True)
+st.plotly_chart(pio.from_json(fig_json["compare_years"]), use_container_width=True)
 
 
 # -------------------------
@@ -494,25 +536,13 @@ if enable_downloads:
             file_name=f"top{top_n}_totals_{selected_year}.html",
             mime="text/html",
         )
-        st.download_button(
-            "Pareto (HTML)",
-            data=fig_to_html_bytes(fig_json["pareto"]),
-            file_name=f"pareto_{selected_year}.html",
-            mime="text/html",
-        )
 
     with d3:
         st.markdown("**Trends**")
         st.download_button(
-            "YoY Total (HTML)",
-            data=fig_to_html_bytes(fig_json["yoy_total"]),
-            file_name="yoy_total_all_years.html",
-            mime="text/html",
-        )
-        st.download_button(
-            "Core vs Tail (HTML)",
-            data=fig_to_html_bytes(fig_json["core_vs_tail"]),
-            file_name=f"core_vs_tail_{selected_year}.html",
+            "Top N Across Years (HTML)",
+            data=fig_to_html_bytes(fig_json["compare_years"]),
+            file_name=f"top{top_n}_items_all_years.html",
             mime="text/html",
         )
 
@@ -522,6 +552,6 @@ if enable_downloads:
 # -------------------------
 with st.expander("Show underlying data (selected year)"):
     st.dataframe(
-        year_df.groupby(["Item", "Month"], as_index=False)[["Amount", "Qty"]].sum(),
+        year_df.groupby(["Item", "Month"], as_index=False, observed=True)[["Amount", "Qty"]].sum(),
         use_container_width=True,
     )